@@ -1,19 +1,25 @@
-from slack_bolt import App
-from slack_bolt.adapter.socket_mode import SocketModeHandler
+import asyncio
+
+from slack_bolt.async_app import AsyncApp
+from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
 
 from bot.config import Config
 import bot.slack_handlers  as handlers
 
 import logging
 
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=Config.LOG_LEVEL.upper())
+
+# HTTP clients log every request at DEBUG; keep them quiet even when debugging the bot
+for _noisy in ("httpx", "urllib3", "openai._base_client"):
+    logging.getLogger(_noisy).setLevel(logging.WARNING)
 
-def main():
+async def main():
     # Check all config values are set
     Config.validate()
 
     # Initialize the Slack app
-    app = App(
+    app = AsyncApp(
         token=Config.SLACK_BOT_TOKEN,
         signing_secret=Config.SLACK_SIGNING_SECRET
     )
@@ -22,8 +28,8 @@ def main():
     handlers.register(app)
 
     # Start the Socket listener
-    handler = SocketModeHandler(app, Config.SLACK_APP_TOKEN)
-    handler.start()
+    handler = AsyncSocketModeHandler(app, Config.SLACK_APP_TOKEN)
+    await handler.start_async()
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
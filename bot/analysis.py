@@ -1,19 +1,81 @@
+import asyncio
+import functools
 import io
 import json
-from typing import List, Optional
+import os
+import multiprocessing
+import re
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from xml.etree import ElementTree
+from typing import TYPE_CHECKING, BinaryIO, Dict, List, Optional, Tuple, Union
 
-import pdfplumber
-import docx
-from openai import OpenAI
 from pydantic import BaseModel, Field
 
+try:
+    import orjson
+except ImportError:  # optional speed-up for parsing batch output
+    import json as orjson
+
 from bot.config import Config
+from bot.llm_cache import llm_cache, make_key
 import logging
 
+# Parsers, tokenizer and OpenAI SDK are imported on first use: they are heavy
+# and a worker that never sees a PDF should not pay for PyMuPDF.
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-_llm = OpenAI(api_key=Config.OPENAI_API_KEY)
+_OPENAI_MODEL = "gpt-4o"
+
+_SYSTEM_PROMPT = (
+    "You are an expert business analyst. "
+    "Extract actionable requirements from the following document. "
+    "Return a JSON object with fields: requirements "
+    "(array of {id, title, description, priority, assignee, estimated_hours, acceptance_criteria}), "
+    "document_summary (brief), and total_requirements (int)."
+)
+
+_COMPLETIONS_ENDPOINT = "/v1/chat/completions"
+
+# Batch polling backoff, in seconds
+_BATCH_POLL_INITIAL = 5.0
+_BATCH_POLL_MAX = 300.0
+_BATCH_TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+# Documents above this many (prefiltered) tokens are split into chunks analysed in parallel
+_MAX_CHUNK_TOKENS = 12_000
+
+# Whole lines that never carry requirements: page footers, copyright notices, TOC headers, blanks
+_BOILERPLATE_LINE_RE = re.compile(
+    r"(?:Page \d+(?: of \d+)?|(?:Copyright\b|©).*\d{4}.*|Table of Contents)?",
+    re.IGNORECASE,
+)
+_WHITESPACE_RE = re.compile(r"[ \t\f\v]+")
+# Numbered section headings such as "3 Scope" or "4.2.1 Login"
+_HEADING_RE = re.compile(r"^\d+(\.\d+)*\s+\w")
+
+# WordprocessingML tags read by _extract_docx
+_W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_W_PARAGRAPH = f"{_W_NS}p"
+_W_TEXT = f"{_W_NS}t"
+_W_TAB = f"{_W_NS}tab"
+_W_BREAKS = (f"{_W_NS}br", f"{_W_NS}cr")
+
+# pdfplumber helpers accept the caller's stream, or raw bytes when shipped to a worker process
+_PdfSource = Union[bytes, BinaryIO]
+
+# pdfplumber spends ~20-80 ms per page, while a task on the warm worker pool adds only
+# a few ms plus ~1 ms/page to re-open the document, so fan out from this many pages.
+# PyMuPDF (~0.2 ms/page) never wins against that overhead and always runs serially.
+_PDFPLUMBER_PARALLEL_MIN_PAGES = 8
+
+# Long-lived pool for pdfplumber fallback extraction, started on first use
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+_pdf_pool_lock = threading.Lock()
 
 
 class Requirement(BaseModel):
@@ -32,98 +94,472 @@ class RequirementExtractionResponse(BaseModel):
     total_requirements: int
 
 
-def extract_text(file_bytes: bytes, filename: str) -> str:
+@functools.lru_cache(maxsize=1)
+def _client() -> "AsyncOpenAI":
+    """
+    Shared OpenAI client, built on first use. httpx's default pool (100 connections)
+    starts raising PoolTimeout once several uploads are analysed at once, so widen it.
+    Its connections belong to the bot's single event loop; call it only from there.
+    """
+    import httpx
+    from openai import AsyncOpenAI
+
+    transport = httpx.AsyncHTTPTransport(
+        limits=httpx.Limits(max_connections=1000, max_keepalive_connections=200)
+    )
+    return AsyncOpenAI(
+        api_key=Config.OPENAI_API_KEY,
+        http_client=httpx.AsyncClient(
+            transport=transport,
+            timeout=httpx.Timeout(60.0, connect=5.0),
+        ),
+    )
+
+
+def extract_text(file: BinaryIO, filename: str) -> str:
     """
     Extract plain text from PDF, DOCX, or fallback to plain UTF-8 decode.
+    `file` is any seekable binary stream; every parser reads it in place.
     """
+    file.seek(0)
     ext = filename.rsplit('.', 1)[-1].lower()
     # PDF handling
     if ext == 'pdf':
-        text = []
-        with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text.append(page_text)
-        return '\n'.join(text)
+        if Config.PDF_BACKEND.lower() == 'pdfplumber':
+            return _extract_pdf_pdfplumber(file)
+        return _extract_pdf_pymupdf(file)
 
     # DOCX handling
     if ext in ('docx', 'doc'):
-        document = docx.Document(io.BytesIO(file_bytes))
-        paragraphs = [para.text for para in document.paragraphs if para.text]
-        return '\n'.join(paragraphs)
+        return _extract_docx(file)
 
     # Fallback for TXT or other text-based
     try:
-        return file_bytes.decode('utf-8', errors='ignore')
+        return file.read().decode('utf-8', errors='ignore')
     except Exception:
         return ''
 
 
-def _strip_code_fences(s: str) -> str:
+def _extract_docx(file: BinaryIO) -> str:
+    """
+    Stream paragraph text out of word/document.xml without building a document model.
+    """
+    buf = io.StringIO()
+    runs: List[str] = []
+    with zipfile.ZipFile(file) as archive, archive.open('word/document.xml') as xml:
+        for _, elem in ElementTree.iterparse(xml):
+            if elem.tag == _W_TEXT:
+                runs.append(elem.text or '')
+            elif elem.tag == _W_TAB:
+                runs.append('\t')
+            elif elem.tag in _W_BREAKS:
+                runs.append('\n')
+            elif elem.tag == _W_PARAGRAPH:
+                if runs:
+                    buf.write(''.join(runs))
+                    buf.write('\n')
+                    runs.clear()
+                elem.clear()
+    return buf.getvalue()
+
+
+def _write_pages(buf: io.StringIO, page_texts: List[str]) -> None:
+    for page_text in page_texts:
+        if page_text:
+            buf.write(page_text)
+            buf.write('\n')
+
+
+def _extract_pdf_pymupdf(file: BinaryIO) -> str:
     """
-    Remove triple-backtick fences (``` or ```json) from a string.
+    Extract PDF text with PyMuPDF, page by page.
     """
-    lines = s.strip().splitlines()
-    if lines and lines[0].startswith("```"):
-        # drop first line
-        lines = lines[1:]
-    if lines and lines[-1].startswith("```"):
-        # drop last line
-        lines = lines[:-1]
-    return "\n".join(lines)
+    import pymupdf
+
+    buf = io.StringIO()
+    with pymupdf.open(stream=file, filetype="pdf") as doc:
+        for page in doc:
+            _write_pages(buf, [page.get_text()])
+    return buf.getvalue()
+
+
+def _pdf_page_count_pdfplumber(source: _PdfSource) -> int:
+    import pdfplumber
+
+    with pdfplumber.open(_as_stream(source)) as pdf:
+        return len(pdf.pages)
 
 
-def analyze_with_openai(document_text: str) -> RequirementExtractionResponse:
+def _extract_pages_pdfplumber(source: _PdfSource, start: int, stop: int) -> List[str]:
+    """
+    Slower, layout-aware extraction for pages [start, stop), for documents PyMuPDF mangles.
+    """
+    import pdfplumber
+
+    pages = list(range(start + 1, stop + 1))  # pdfplumber page numbers are 1-based
+    with pdfplumber.open(_as_stream(source), pages=pages) as pdf:
+        return [page.extract_text() or '' for page in pdf.pages]
+
+
+def _as_stream(source: _PdfSource) -> BinaryIO:
+    return io.BytesIO(source) if isinstance(source, bytes) else source
+
+
+def _page_ranges(page_count: int, workers: int) -> List[Tuple[int, int]]:
+    """
+    Split [0, page_count) into one contiguous range per worker.
+    """
+    step = -(-page_count // workers)  # ceiling division
+    return [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            # spawn, not fork: this runs inside the Slack handler's threads
+            _pdf_pool = ProcessPoolExecutor(
+                max_workers=os.cpu_count(),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pdf_pool
+
+
+def _extract_pdf_pdfplumber(file: BinaryIO) -> str:
+    """
+    Extract PDF text with pdfplumber, fanning page ranges out to the shared worker
+    pool for longer documents. pdfminer is pure Python and holds the GIL, so the
+    workers are processes; each opens its own copy of the document.
+    """
+    page_count = _pdf_page_count_pdfplumber(file)
+    file.seek(0)
+    workers = min(os.cpu_count() or 1, page_count)
+    buf = io.StringIO()
+
+    if page_count < _PDFPLUMBER_PARALLEL_MIN_PAGES or workers < 2:
+        _write_pages(buf, _extract_pages_pdfplumber(file, 0, page_count))
+        return buf.getvalue()
+
+    # Worker processes need a picklable copy of the document
+    file_bytes = file.read()
+    starts, stops = zip(*_page_ranges(page_count, workers))
+    # map() yields ranges in page order and drops each result once consumed
+    for page_texts in _get_pdf_pool().map(
+        _extract_pages_pdfplumber, [file_bytes] * len(starts), starts, stops
+    ):
+        _write_pages(buf, page_texts)
+    return buf.getvalue()
+
+
+async def analyze_with_openai(document_text: str) -> RequirementExtractionResponse:
     """
     Use OpenAI's client API to extract requirements from the document text.
+    Identical documents are answered from the in-process cache.
+    """
+    # Prefiltering and tokenizing are CPU-bound; keep them off the event loop
+    document_text = await asyncio.to_thread(_prefilter, document_text)
+    cache_key = make_key(_OPENAI_MODEL, _SYSTEM_PROMPT, document_text)
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        logger.info("Serving analysis from LLM cache (%s)", cache_key[:12])
+        return cached
+
+    chunks = await asyncio.to_thread(_split_for_model, document_text)
+    if len(chunks) == 1:
+        result = await _complete(chunks[0])
+    else:
+        logger.info("Document exceeds %d tokens; analysing %d chunks", _MAX_CHUNK_TOKENS, len(chunks))
+        result = _merge_results(await asyncio.gather(*(_complete(chunk) for chunk in chunks)))
+
+    llm_cache.set(cache_key, result)
+    return result
+
+
+async def _complete(document_text: str) -> RequirementExtractionResponse:
+    response = await _client().chat.completions.create(**_completion_body(document_text))
+
+    message = response.choices[0].message
+    return _parse_response_content(message.content, getattr(message, "refusal", None))
+
+
+def _prefilter(text: str) -> str:
+    """
+    Drop boilerplate lines and collapse runs of whitespace to cut input tokens.
+    """
+    lines = (_WHITESPACE_RE.sub(" ", line).strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if not _BOILERPLATE_LINE_RE.fullmatch(line))
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    """
+    gpt-4o's tokenizer, or None if it cannot be loaded (tiktoken fetches it over the
+    network on first use); token counts then fall back to an estimate.
+    """
+    try:
+        import tiktoken
+
+        return tiktoken.encoding_for_model(_OPENAI_MODEL)
+    except Exception as e:
+        logger.warning("Could not load tiktoken encoding, estimating token counts: %s", e)
+        return None
+
+
+def _count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return len(text) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _split_for_model(text: str) -> List[str]:
+    """
+    Return the text as one chunk if it fits in _MAX_CHUNK_TOKENS, otherwise split it
+    at numbered headings and pack whole sections greedily into chunks under the limit.
+    Sections that are too large on their own are split line by line.
     """
-    system_prompt = (
-        "You are an expert business analyst. "
-        "Extract actionable requirements from the following document. "
-        "Return a JSON object with fields: requirements "
-        "(array of {id, title, description, priority, assignee, estimated_hours, acceptance_criteria}), "
-        "document_summary (brief), and total_requirements (int)."
+    # A token never spans less than one byte, so short texts need no tokenizing
+    if len(text.encode("utf-8")) <= _MAX_CHUNK_TOKENS:
+        return [text]
+
+    sections: List[List[str]] = [[]]
+    for line in text.splitlines():
+        if _HEADING_RE.match(line) and sections[-1]:
+            sections.append([])
+        sections[-1].append(line)
+
+    # Tokenize each section once; an oversized section contributes one piece per line
+    pieces: List[Tuple[str, int]] = []
+    for section in sections:
+        section_text = "\n".join(section)
+        section_tokens = _count_tokens(section_text)
+        if section_tokens <= _MAX_CHUNK_TOKENS:
+            pieces.append((section_text, section_tokens))
+        else:
+            pieces.extend((line, _count_tokens(line)) for line in section)
+
+    if sum(tokens for _, tokens in pieces) <= _MAX_CHUNK_TOKENS:
+        return [text]
+
+    chunks: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+    for piece_text, piece_tokens in pieces:
+        if current and current_tokens + piece_tokens > _MAX_CHUNK_TOKENS:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(piece_text)
+        current_tokens += piece_tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def _merge_results(partials: List[RequirementExtractionResponse]) -> RequirementExtractionResponse:
+    """
+    Combine per-chunk responses, renumbering requirement ids so they stay unique.
+    """
+    requirements = [req for partial in partials for req in partial.requirements]
+    for n, req in enumerate(requirements, start=1):
+        req.id = f"REQ-{n:03d}"
+    summaries = [partial.document_summary for partial in partials if partial.document_summary]
+    return RequirementExtractionResponse(
+        requirements=requirements,
+        document_summary=" ".join(summaries) or None,
+        total_requirements=len(requirements),
     )
 
-    response = _llm.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": system_prompt},
+
+def _parse_response_content(content: Optional[str], refusal: Optional[str] = None) -> RequirementExtractionResponse:
+    """
+    Validate the model's schema-constrained JSON output into a response model.
+    """
+    if refusal:
+        raise ValueError(f"OpenAI refused to analyse the document: {refusal}")
+    if not content:
+        raise ValueError("OpenAI response did not contain any content.")
+
+    return RequirementExtractionResponse.model_validate_json(content)
+
+
+def _strict_json_schema(model: type) -> Dict:
+    """
+    Adapt a Pydantic JSON schema to OpenAI's strict structured-output rules:
+    every object closed to extra keys, every property required, no defaults.
+    """
+    def visit(node):
+        if isinstance(node, dict):
+            if node.get("type") == "object" and "properties" in node:
+                node["additionalProperties"] = False
+                node["required"] = list(node["properties"])
+            node.pop("default", None)
+            for value in node.values():
+                visit(value)
+        elif isinstance(node, list):
+            for value in node:
+                visit(value)
+
+    schema = model.model_json_schema()
+    visit(schema)
+    return schema
+
+
+# Structured output: the model is constrained to emit exactly this schema
+_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "RequirementExtractionResponse",
+        "schema": _strict_json_schema(RequirementExtractionResponse),
+        "strict": True,
+    },
+}
+
+
+def _completion_body(document_text: str) -> Dict:
+    return {
+        "model": _OPENAI_MODEL,
+        "messages": [
+            {"role": "system", "content": _SYSTEM_PROMPT},
             {"role": "user",   "content": document_text}
         ],
-        temperature=0.1,
+        "temperature": 0.1,
+        "response_format": _RESPONSE_FORMAT,
+    }
+
+
+async def analyze_with_openai_batch(
+    texts: List[Tuple[str, str]]
+) -> Dict[str, RequirementExtractionResponse]:
+    """
+    Analyse many documents through OpenAI's Batch API (half the per-token cost,
+    up to a 24h turnaround). Takes (custom_id, document_text) pairs and returns
+    {custom_id: response}; documents that failed are logged and left out.
+    Oversized documents are chunked as in analyze_with_openai, one batch line per chunk.
+    """
+    results: Dict[str, RequirementExtractionResponse] = {}
+    cache_keys: Dict[str, str] = {}
+    partials: Dict[str, List[Optional[RequirementExtractionResponse]]] = {}
+    lines = []
+
+    for custom_id, document_text in texts:
+        document_text = await asyncio.to_thread(_prefilter, document_text)
+        cache_key = make_key(_OPENAI_MODEL, _SYSTEM_PROMPT, document_text)
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            results[custom_id] = cached
+            continue
+        cache_keys[custom_id] = cache_key
+        chunks = await asyncio.to_thread(_split_for_model, document_text)
+        partials[custom_id] = [None] * len(chunks)
+        for n, chunk in enumerate(chunks):
+            lines.append(json.dumps({
+                "custom_id": f"{custom_id}#{n}",
+                "method":    "POST",
+                "url":       _COMPLETIONS_ENDPOINT,
+                "body":      _completion_body(chunk),
+            }))
+
+    if not lines:
+        return results
+
+    batch_file = await _client().files.create(
+        file=("prd_batch.jsonl", "\n".join(lines).encode("utf-8")),
+        purpose="batch",
+    )
+    batch = await _client().batches.create(
+        input_file_id=batch_file.id,
+        endpoint=_COMPLETIONS_ENDPOINT,
+        completion_window="24h",
     )
+    logger.info("Submitted OpenAI batch %s with %d requests", batch.id, len(lines))
 
-    content_raw = response.choices[0].message.content
-    if not content_raw:
-        raise ValueError("OpenAI response did not contain any content.")
+    delay = _BATCH_POLL_INITIAL
+    while batch.status not in _BATCH_TERMINAL_STATUSES:
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, _BATCH_POLL_MAX)
+        batch = await _client().batches.retrieve(batch.id)
 
-    content = _strip_code_fences(content_raw)
+    if batch.status != "completed":
+        raise RuntimeError(f"OpenAI batch {batch.id} ended with status '{batch.status}'.")
+    if batch.error_file_id:
+        logger.error("OpenAI batch %s had failed requests; see error file %s", batch.id, batch.error_file_id)
+    if not batch.output_file_id:
+        # Every request failed; only cache hits can be returned
+        return results
 
-    # parse JSON
-    try:
-        data = json.loads(content)
-    except json.JSONDecodeError as e:
-        logger.error("Failed to parse JSON from model response: %s", e)
-        logger.error("Raw model output:\n%s", content_raw)
-        raise ValueError(f"Could not parse JSON from model response: {e}")
+    output = await _client().files.content(batch.output_file_id)
+    for line in output.text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            item = orjson.loads(line)
+        except ValueError as e:
+            logger.error("Skipping malformed batch output line: %s", e)
+            continue
+
+        # custom_id is "<document id>#<chunk index>"; skip anything we did not submit
+        request_id = item.get("custom_id") or ""
+        custom_id, _, n = request_id.rpartition("#")
+        chunk_results = partials.get(custom_id)
+        if chunk_results is None or not n.isdigit() or int(n) >= len(chunk_results):
+            logger.error("Skipping batch output with unknown custom_id %r", request_id)
+            continue
+
+        response = item.get("response") or {}
+        if item.get("error") or response.get("status_code") != 200:
+            logger.error("Batch request %s failed: %s", request_id, item.get("error") or response)
+            continue
+        try:
+            message = response["body"]["choices"][0]["message"]
+            result = _parse_response_content(message.get("content"), message.get("refusal"))
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            logger.error("Batch request %s returned unusable output: %s", request_id, e)
+            continue
+        chunk_results[int(n)] = result
+
+    # A document only counts as analysed if every one of its chunks came back
+    for custom_id, chunk_results in partials.items():
+        if any(result is None for result in chunk_results):
+            continue
+        result = chunk_results[0] if len(chunk_results) == 1 else _merge_results(chunk_results)
+        llm_cache.set(cache_keys[custom_id], result)
+        results[custom_id] = result
 
-    return RequirementExtractionResponse(**data)
+    return results
 
 
-def analyze_document(file_bytes: bytes, filename: str) -> RequirementExtractionResponse:
+async def analyze_document_async(file: BinaryIO, filename: str) -> RequirementExtractionResponse:
     """
     Top-level document analysis entrypoint. Chooses the backend model based on config.
     """
-    text = extract_text(file_bytes, filename)
+    # Parsing is CPU-bound; keep it off the event loop
+    text = await asyncio.to_thread(extract_text, file, filename)
     model = Config.ANALYSIS_MODEL.lower()
 
     if model == 'openai':
-        return analyze_with_openai(text)
+        return await analyze_with_openai(text)
     elif model == 'claude':
         raise NotImplementedError("Claude model integration not yet implemented.")
     elif model == 'local':
         raise NotImplementedError("Local model integration not yet implemented.")
     else:
         raise ValueError(f"Unknown ANALYSIS_MODEL: {Config.ANALYSIS_MODEL}")
+
+
+async def analyze_documents_batch(
+    files: List[Tuple[BinaryIO, str]]
+) -> List[Optional[RequirementExtractionResponse]]:
+    """
+    Bulk entrypoint for archived PRD backlogs. Takes (file, filename) pairs and
+    returns one result per file, in order; None marks a document that failed.
+    """
+    model = Config.ANALYSIS_MODEL.lower()
+    if model != 'openai':
+        raise NotImplementedError(f"Bulk analysis is only available for the OpenAI model, not '{model}'.")
+
+    texts = [
+        (f"doc-{i}", await asyncio.to_thread(extract_text, file, filename))
+        for i, (file, filename) in enumerate(files)
+    ]
+    results = await analyze_with_openai_batch(texts)
+    return [results.get(custom_id) for custom_id, _ in texts]
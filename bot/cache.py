@@ -0,0 +1,95 @@
+# bot/cache.py
+
+import json
+import threading
+from typing import Any, Optional, Protocol
+
+from cachetools import LRUCache, TTLCache
+from pydantic import BaseModel
+
+from bot.config import Config
+
+
+class CacheBackend(Protocol):
+    """
+    Minimal key/value interface shared by the in-process and Redis caches.
+    """
+
+    def get(self, key: str) -> Optional[Any]: ...
+
+    def set(self, key: str, value: Any) -> None: ...
+
+    def pop(self, key: str) -> Optional[Any]: ...
+
+
+class MemoryCache:
+    """
+    Process-local LRU cache; entries expire after `ttl` seconds unless ttl is None.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 3600):
+        self._data = TTLCache(maxsize=maxsize, ttl=ttl) if ttl else LRUCache(maxsize=maxsize)
+        # cachetools caches are not thread-safe on their own
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            return self._data.get(key)
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+
+    def pop(self, key: str) -> Optional[Any]:
+        with self._lock:
+            return self._data.pop(key, None)
+
+
+def _to_json(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    raise TypeError(f"Cannot store {type(value).__name__} in Redis")
+
+
+class RedisCache:
+    """
+    Redis-backed cache shared by every bot worker and surviving restarts.
+    Values are stored as JSON (Pydantic models are dumped), so reads return plain dicts/lists.
+    Calls block on the network, so async code should run them via asyncio.to_thread.
+    """
+
+    def __init__(self, url: str, prefix: str, ttl: Optional[int] = 3600):
+        import redis
+
+        self._client = redis.Redis.from_url(url)
+        self._prefix = prefix
+        self._ttl = ttl
+
+    def _key(self, key: str) -> str:
+        return f"{self._prefix}:{key}"
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self._client.get(self._key(key))
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: Any) -> None:
+        self._client.set(self._key(key), json.dumps(value, default=_to_json), ex=self._ttl)
+
+    def pop(self, key: str) -> Optional[Any]:
+        pipe = self._client.pipeline()
+        pipe.get(self._key(key))
+        pipe.delete(self._key(key))
+        raw, _ = pipe.execute()
+        return json.loads(raw) if raw is not None else None
+
+
+def make_cache(prefix: str, maxsize: int = 1024, ttl: Optional[int] = 3600) -> CacheBackend:
+    """
+    Build the cache selected by Config.CACHE_BACKEND. `prefix` namespaces keys in Redis.
+    """
+    backend = Config.CACHE_BACKEND.lower()
+    if backend == "redis":
+        return RedisCache(Config.REDIS_URL, prefix, ttl=ttl)
+    if backend == "memory":
+        return MemoryCache(maxsize=maxsize, ttl=ttl)
+    raise ValueError(f"Unknown CACHE_BACKEND: {Config.CACHE_BACKEND}")
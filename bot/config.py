@@ -19,6 +19,16 @@ class Config:
     OPENAI_API_KEY      = os.getenv("OPENAI_API_KEY")
     ANALYSIS_MODEL      = os.getenv("ANALYSIS_MODEL", "openai")  # 'openai', 'claude', or 'local'
 
+    # Document parsing
+    PDF_BACKEND         = os.getenv("PDF_BACKEND", "pymupdf")  # 'pymupdf' or 'pdfplumber'
+
+    # Logging
+    LOG_LEVEL           = os.getenv("LOG_LEVEL", "INFO")  # e.g., 'DEBUG' while developing
+
+    # Cache
+    CACHE_BACKEND       = os.getenv("CACHE_BACKEND", "memory")  # 'memory' or 'redis'
+    REDIS_URL           = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
     @classmethod
     def validate(cls):
         missing = []
@@ -37,4 +47,8 @@ class Config:
         if missing:
             raise RuntimeError(f"Missing required config vars: {', '.join(missing)}")
         if cls.ANALYSIS_MODEL not in ["openai", "claude", "local"]:
-            raise ValueError(f"Invalid ANALYSIS_MODEL: {cls.ANALYSIS_MODEL}. Must be one of 'openai', 'claude', or 'local'.")
\ No newline at end of file
+            raise ValueError(f"Invalid ANALYSIS_MODEL: {cls.ANALYSIS_MODEL}. Must be one of 'openai', 'claude', or 'local'.")
+        if cls.PDF_BACKEND.lower() not in ["pymupdf", "pdfplumber"]:
+            raise ValueError(f"Invalid PDF_BACKEND: {cls.PDF_BACKEND}. Must be one of 'pymupdf' or 'pdfplumber'.")
+        if cls.CACHE_BACKEND.lower() not in ["memory", "redis"]:
+            raise ValueError(f"Invalid CACHE_BACKEND: {cls.CACHE_BACKEND}. Must be one of 'memory' or 'redis'.")
\ No newline at end of file
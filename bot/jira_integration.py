@@ -1,13 +1,17 @@
 # bot/jira_integration.py
 
-import time
-import random
+import hashlib
 import logging
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Dict, Optional, Tuple, Union
 
 import requests
+from pydantic import BaseModel
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
+from urllib3.util.retry import Retry
 
+from bot.cache import make_cache
 from bot.config import Config
 
 logger = logging.getLogger(__name__)
@@ -20,6 +24,49 @@ _PRIORITY_MAPPING = {
     "Minor":    "Low"
 }
 
+# Jira's bulk endpoint accepts at most 50 issues per request
+_BULK_BATCH_SIZE = 50
+
+# Concurrent single-issue creates when the bulk endpoint is unavailable
+_SINGLE_CREATE_WORKERS = 8
+
+# Responses urllib3 retries for us (honouring Retry-After) before handing them back.
+# Only statuses where Jira did not process the create: after a 502/504 it may have.
+_RETRY_STATUSES = (429, 503)
+
+# Endpoints derived once from config instead of on every call
+_JIRA_BASE     = (Config.JIRA_URL or "").rstrip("/")
+_ISSUE_URL     = f"{_JIRA_BASE}/rest/api/3/issue"
+_BULK_URL      = f"{_ISSUE_URL}/bulk"
+_BROWSE_PREFIX = f"{_JIRA_BASE}/browse/"
+
+# Content hash of a requirement → key of the Jira issue already created for it
+_ISSUE_INDEX = make_cache("jira-issue", maxsize=10_000, ttl=None)
+
+# Keep-alive session shared by every Jira call
+_session = requests.Session()
+_session.auth = HTTPBasicAuth(Config.JIRA_EMAIL or "", Config.JIRA_API_TOKEN or "")
+_session.headers.update({
+    "Accept": "application/json",
+    "Content-Type": "application/json"
+})
+_adapter = HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=50,
+    max_retries=Retry(
+        total=5,
+        # Never re-send a create after the request went out: Jira may have committed it
+        read=0,
+        backoff_factor=0.5,
+        status_forcelist=_RETRY_STATUSES,
+        allowed_methods=["POST"],
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    ),
+)
+_session.mount("https://", _adapter)
+_session.mount("http://", _adapter)
+
 
 def format_adf_description(text: str) -> Dict:
     """
@@ -37,122 +84,257 @@ def format_adf_description(text: str) -> Dict:
     }
 
 
-def create_jira_tasks(requirements: List[Dict]) -> List[Dict]:
+def _field(req: Union[BaseModel, Dict], name: str) -> Any:
+    """
+    Read a requirement field from either a Requirement model or its dict form.
+    """
+    if isinstance(req, dict):
+        return req.get(name)
+    return getattr(req, name, None)
+
+
+def _build_fields(req: Union[BaseModel, Dict]) -> Dict:
     """
-    Given a list of requirement dicts, create Jira issues for each and return list of
-    {requirement_id, jira_key, jira_url}.
+    Build the Jira issue fields for a single requirement.
     """
-    jira_url = (Config.JIRA_URL or "").rstrip("/")
-    url = f"{jira_url}/rest/api/3/issue"
-    auth = HTTPBasicAuth(Config.JIRA_EMAIL or "", Config.JIRA_API_TOKEN or "")
-    headers = {
-        "Accept": "application/json",
-        "Content-Type": "application/json"
+    fields = {
+        "project":     {"key": Config.JIRA_PROJECT_KEY},
+        "summary":     _field(req, "title") or "No title provided",
+        "description": format_adf_description(_field(req, "description") or ""),
+        "issuetype":   {"name": "Task"},
+        "labels":      ["automated", "prd-generated"],
     }
 
-    created_tasks = []
+    # Apply mapped priority if provided
+    raw_prio = _field(req, "priority")
+    if raw_prio:
+        jira_prio = _PRIORITY_MAPPING.get(raw_prio, raw_prio)
+        fields["priority"] = {"name": jira_prio}
 
-    for req in requirements:
-        # Build payload
-        fields = {
-            "project":     {"key": Config.JIRA_PROJECT_KEY},
-            "summary":     req.get("title", "No title provided"),
-            "description": format_adf_description(req.get("description", "")),
-            "issuetype":   {"name": "Task"},
-            "labels":      ["automated", "prd-generated"],
+    # Add optional fields if they exist in the requirement
+    assignee = _field(req, "assignee")
+    if assignee:
+        fields["assignee"] = {"accountId": assignee}
+    estimated_hours = _field(req, "estimated_hours")
+    if estimated_hours:
+        fields["timetracking"] = {
+            "originalEstimate": f"{estimated_hours}h"
         }
+    return fields
 
-        # Apply mapped priority if provided
-        raw_prio = req.get("priority")
-        if raw_prio:
-            jira_prio = _PRIORITY_MAPPING.get(raw_prio, raw_prio)
-            fields["priority"] = {"name": jira_prio}
-
-        # Add optional fields if they exist in the requirement document dict
-        if req.get("assignee"):
-            fields["assignee"] = {"accountId": req["assignee"]}
-        if req.get("estimated_hours"):
-            fields["timetracking"] = {
-                "originalEstimate": f"{req['estimated_hours']}h"
-            }
 
-        payload = {"fields": fields}
-
-        # Attempt create with rate-limit retries
-        max_retries = 3
-        for attempt in range(max_retries + 1):
-            resp = requests.post(url, json=payload, auth=auth, headers=headers)
-
-            # Success
-            if resp.status_code == 201:
-                issue = resp.json()
-                key = issue["key"]
-                created_tasks.append({
-                    "requirement_id": req.get("id"),
-                    "jira_key":       key,
-                    "jira_url":       f"{(Config.JIRA_URL or '').rstrip('/')}/browse/{key}"
-                })
-                break
-
-            # Rate limited
-            elif resp.status_code == 429:
-                retry_after = int(resp.headers.get("Retry-After", 60))
-                if attempt < max_retries:
-                    wait = retry_after + random.random()
-                    logger.warning(f"Rate limited by Jira; retrying in {wait:.1f}s.")
-                    time.sleep(wait)
-                    continue
-                else:
-                    resp.raise_for_status()
-
-            # Other errors
-            else:
-                # Attempt to parse JSON error
-                err = {}
-                try:
-                    err = resp.json()
-                except ValueError:
-                    resp.raise_for_status()
-
-                messages     = err.get("errorMessages", [])
-                field_errors = err.get("errors", {})
-
-                # If it's a priority‐field error, retry once without priority
-                if "priority" in field_errors:
-                    logger.warning(
-                        f"Priority field rejected for requirement {req.get('id')}, "
-                        "retrying without priority."
-                    )
-                    # Remove priority and retry immediately
-                    payload["fields"].pop("priority", None)
-                    resp2 = requests.post(url, json=payload, auth=auth, headers=headers)
-                    if resp2.status_code == 201:
-                        issue = resp2.json()
-                        key = issue["key"]
-                        created_tasks.append({
-                            "requirement_id": req.get("id"),
-                            "jira_key":       key,
-                            "jira_url":       f"{(Config.JIRA_URL or '').rstrip('/')}/browse/{key}"
-                        })
-                        break
-                    else:
-                        # fail on second attempt
-                        err2 = {}
-                        try:
-                            err2 = resp2.json()
-                        except ValueError:
-                            resp2.raise_for_status()
-                        logger.error(
-                            f"Retry without priority also failed for {req.get('id')}: "
-                            f"{err2.get('errorMessages', [])} {err2.get('errors', {})}"
-                        )
-                        raise Exception(f"Jira API error: {err2}")
-                else:
-                    # other field or general error: return
-                    logger.error(
-                        f"Failed to create Jira issue for requirement {req.get('id')}: "
-                        f"{messages} {field_errors}"
-                    )
-                    raise Exception(f"Jira API error: {messages} {field_errors}")
-
-    return created_tasks
+class _BulkCreateUnavailable(Exception):
+    """
+    The Jira instance does not expose /rest/api/3/issue/bulk.
+    """
+
+
+def _bulk_create(field_sets: List[Dict]) -> Tuple[List[Optional[str]], Dict[int, Dict]]:
+    """
+    Create up to _BULK_BATCH_SIZE issues in one request. Returns the created key for
+    each element (None where it failed) and the Jira error body per failed element.
+    """
+    payload = {"issueUpdates": [{"fields": fields} for fields in field_sets]}
+
+    # Rate limits and unavailability are retried by the session's adapter
+    resp = _session.post(_BULK_URL, json=payload)
+    if resp.status_code in (404, 405):
+        raise _BulkCreateUnavailable()
+    if resp.status_code in _RETRY_STATUSES:
+        logger.error(f"Jira still returned {resp.status_code} after retries.")
+        resp.raise_for_status()
+
+    # Attempt to parse JSON body (present on full and partial failures too)
+    try:
+        data = resp.json()
+    except ValueError:
+        resp.raise_for_status()
+        raise
+
+    # A bulk result lists per-element errors; anything else is Jira's standard error body
+    if not isinstance(data, dict):
+        logger.error(f"Jira bulk create failed ({resp.status_code}): {data}")
+        raise Exception(f"Jira API error: {data}")
+    if resp.status_code not in (201, 400) or not isinstance(data.get("errors", []), list):
+        logger.error(f"Jira bulk create failed ({resp.status_code}): {data}")
+        raise Exception(f"Jira API error: {data.get('errorMessages')} {data.get('errors')}")
+
+    # Jira lists created issues in submission order, skipping the failed elements
+    errors = {
+        err["failedElementNumber"]: err.get("elementErrors", {})
+        for err in data.get("errors", [])
+    }
+    issues = data.get("issues", [])
+    succeeded = [i for i in range(len(field_sets)) if i not in errors]
+    if len(issues) != len(succeeded):
+        logger.error(
+            f"Jira bulk create returned {len(issues)} issues for {len(succeeded)} "
+            f"successful elements: {data}"
+        )
+        raise Exception(f"Jira API error: {data}")
+
+    keys: List[Optional[str]] = [None] * len(field_sets)
+    for i, issue in zip(succeeded, issues):
+        keys[i] = issue["key"]
+    return keys, errors
+
+
+def _create_batch(batch: List[Union[BaseModel, Dict]], on_created: Callable[[int, str], None]) -> None:
+    """
+    Create one bulk batch of issues, resubmitting priority-rejected elements
+    without their priority. on_created(index, key) is called for every issue as
+    soon as Jira returns it, so issues created before a failure are not lost.
+    """
+    field_sets = [_build_fields(req) for req in batch]
+    keys, errors = _bulk_create(field_sets)
+    for i, key in enumerate(keys):
+        if key:
+            on_created(i, key)
+
+    retry = []
+    for i, element_errors in errors.items():
+        messages     = element_errors.get("errorMessages", [])
+        field_errors = element_errors.get("errors", {})
+
+        # If it's a priority‐field error, retry once without priority
+        if "priority" in field_errors:
+            logger.warning(
+                f"Priority field rejected for requirement {_field(batch[i], 'id')}, "
+                "retrying without priority."
+            )
+            field_sets[i].pop("priority", None)
+            retry.append(i)
+        else:
+            # other field or general error: return
+            logger.error(
+                f"Failed to create Jira issue for requirement {_field(batch[i], 'id')}: "
+                f"{messages} {field_errors}"
+            )
+            raise Exception(f"Jira API error: {messages} {field_errors}")
+
+    if retry:
+        retry_keys, retry_errors = _bulk_create([field_sets[i] for i in retry])
+        for i, key in zip(retry, retry_keys):
+            if key:
+                on_created(i, key)
+        for j, element_errors in retry_errors.items():
+            logger.error(
+                f"Retry without priority also failed for {_field(batch[retry[j]], 'id')}: "
+                f"{element_errors.get('errorMessages', [])} {element_errors.get('errors', {})}"
+            )
+        if retry_errors:
+            raise Exception(f"Jira API error: {list(retry_errors.values())}")
+
+
+def _create_one(req: Union[BaseModel, Dict]) -> str:
+    """
+    Create a single issue via /rest/api/3/issue, retrying once without priority
+    if Jira rejects it. Returns the Jira key.
+    """
+    payload = {"fields": _build_fields(req)}
+
+    for attempt in range(2):
+        resp = _session.post(_ISSUE_URL, json=payload)
+        if resp.status_code == 201:
+            return resp.json()["key"]
+        if resp.status_code in _RETRY_STATUSES:
+            logger.error(f"Jira still returned {resp.status_code} after retries.")
+            resp.raise_for_status()
+
+        # Attempt to parse JSON error
+        err = {}
+        try:
+            err = resp.json()
+        except ValueError:
+            resp.raise_for_status()
+
+        messages     = err.get("errorMessages", [])
+        field_errors = err.get("errors", {})
+
+        # If it's a priority‐field error, retry once without priority
+        if attempt == 0 and "priority" in field_errors:
+            logger.warning(
+                f"Priority field rejected for requirement {_field(req, 'id')}, "
+                "retrying without priority."
+            )
+            payload["fields"].pop("priority", None)
+            continue
+
+        logger.error(
+            f"Failed to create Jira issue for requirement {_field(req, 'id')}: "
+            f"{messages} {field_errors}"
+        )
+        raise Exception(f"Jira API error: {messages} {field_errors}")
+
+
+def _requirement_hash(req: Union[BaseModel, Dict]) -> str:
+    """
+    Identify a requirement by its title and description, ignoring its id.
+    """
+    content = f"{_field(req, 'title') or ''}|{_field(req, 'description') or ''}"
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def create_jira_tasks(requirements: List[Union[BaseModel, Dict]], force: bool = False) -> List[Dict]:
+    """
+    Given a list of requirements (Requirement models or dicts), create Jira issues for each and return list of
+    {requirement_id, jira_key, jira_url, existing}.
+
+    Requirements whose title and description match an issue created earlier reuse
+    that issue (existing=True) unless force is set; duplicates within the list share
+    one issue. New issues are created through the bulk endpoint; if the Jira instance
+    does not offer it, they are created one per request across a small thread pool.
+    """
+    hashes = [_requirement_hash(req) for req in requirements]
+
+    keys: Dict[str, str] = {}
+    if not force:
+        for req_hash in hashes:
+            key = _ISSUE_INDEX.get(req_hash)
+            if key:
+                keys[req_hash] = key
+    existing = set(keys)
+
+    pending = []
+    pending_hashes = set()
+    for req, req_hash in zip(requirements, hashes):
+        if req_hash not in keys and req_hash not in pending_hashes:
+            pending_hashes.add(req_hash)
+            pending.append((req, req_hash))
+    if existing:
+        logger.info(f"Reusing {len(existing)} existing Jira issue(s) for duplicate requirements.")
+
+    use_bulk = True
+    for start in range(0, len(pending), _BULK_BATCH_SIZE):
+        batch = [req for req, _ in pending[start:start + _BULK_BATCH_SIZE]]
+        batch_hashes = [req_hash for _, req_hash in pending[start:start + _BULK_BATCH_SIZE]]
+
+        # Index every issue the moment it exists, even if the rest of the batch fails
+        def record(i: int, key: str) -> None:
+            keys[batch_hashes[i]] = key
+            _ISSUE_INDEX.set(batch_hashes[i], key)
+
+        def create_one(i: int) -> None:
+            record(i, _create_one(batch[i]))
+
+        created = False
+        if use_bulk:
+            try:
+                _create_batch(batch, record)
+                created = True
+            except _BulkCreateUnavailable:
+                logger.warning("Jira bulk create endpoint unavailable; creating issues individually.")
+                use_bulk = False
+        if not created:
+            with ThreadPoolExecutor(max_workers=_SINGLE_CREATE_WORKERS) as executor:
+                list(executor.map(create_one, range(len(batch))))
+
+    return [
+        {
+            "requirement_id": _field(req, "id"),
+            "jira_key":       keys[req_hash],
+            "jira_url":       _BROWSE_PREFIX + keys[req_hash],
+            "existing":       req_hash in existing,
+        }
+        for req, req_hash in zip(requirements, hashes)
+    ]
@@ -0,0 +1,56 @@
+# bot/llm_cache.py
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+# Baked into every key: bump it whenever the prompt or response schema changes
+PROMPT_VERSION = "v1"
+
+
+def make_key(model: str, system_prompt: str, document_text: str) -> str:
+    """
+    Hash everything that determines the model's answer into a fixed-size cache key.
+    """
+    digest = hashlib.sha256()
+    for part in (PROMPT_VERSION, model, system_prompt, document_text):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class LLMCache:
+    """
+    Thread-safe LRU cache with per-entry expiry for parsed LLM responses.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 24 * 60 * 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+# Shared by every analysis call in this process
+llm_cache = LLMCache()
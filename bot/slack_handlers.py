@@ -1,118 +1,218 @@
+import asyncio
+import io
 import json
-import requests
 import uuid
-from slack_bolt import App
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+from slack_bolt.async_app import AsyncApp
 from slack_sdk.errors import SlackApiError
 
+from bot.cache import make_cache
 from bot.config import Config
-from bot.analysis import analyze_document
+from bot.analysis import RequirementExtractionResponse, analyze_document_async, analyze_documents_batch
 from bot.jira_integration import create_jira_tasks
 
-# Simple in-memory cache: maps slacks UUID → list of requirement dicts
-ANALYSIS_CACHE = {}
+# Maps slacks UUID → list of requirements (in-memory or Redis, see Config.CACHE_BACKEND)
+ANALYSIS_CACHE = make_cache("analysis")
+
+# Uploads whose message starts with this are analysed through the OpenAI Batch API
+BULK_ANALYZE_TRIGGER = "bulk analyze"
+
+_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Shared HTTP session for file downloads; created lazily inside the running event loop
+_http: Optional[aiohttp.ClientSession] = None
+
+
+def _http_session() -> aiohttp.ClientSession:
+    global _http
+    if _http is None or _http.closed:
+        _http = aiohttp.ClientSession()
+    return _http
+
+
+async def _download_file(client, file_id: str) -> Tuple[io.BytesIO, str]:
+    """
+    Stream a Slack-hosted file into memory; returns (file, filename).
+    """
+    info = (await client.files_info(file=file_id))["file"]
+    download_url = info["url_private_download"]
+
+    async with _http_session().get(
+        download_url,
+        headers={"Authorization": f"Bearer {Config.SLACK_BOT_TOKEN}"},
+        raise_for_status=True
+    ) as resp:
+        body = io.BytesIO()
+        async for chunk in resp.content.iter_chunked(_DOWNLOAD_CHUNK_SIZE):
+            body.write(chunk)
+    body.seek(0)
+    return body, info.get("name")
+
+
+def _preview_blocks(analysis: RequirementExtractionResponse, cache_key: str, heading: str) -> List[Dict]:
+    """
+    Build the requirement preview with its "Create Jira Tasks" buttons. "Force Re-create"
+    skips the duplicate check and creates fresh issues even for already-seen requirements.
+    """
+    blocks = [
+        {
+            "type": "section",
+            "text": {
+                "type": "mrkdwn",
+                "text": heading
+            }
+        }
+    ]
+    for req in analysis.requirements:
+        blocks.append({
+            "type": "section",
+            "text": {
+                "type": "mrkdwn",
+                "text": f"• *{req.id}*: {req.title} _(Priority: {req.priority})_"
+            }
+        })
+
+    blocks.append({
+        "type": "actions",
+        "elements": [
+            {
+                "type": "button",
+                "text": {"type": "plain_text", "text": "Create Jira Tasks"},
+                "style": "primary",
+                "action_id": "create_tasks",
+                "value": cache_key
+            },
+            {
+                "type": "button",
+                "text": {"type": "plain_text", "text": "Force Re-create"},
+                "action_id": "force_create_tasks",
+                "value": cache_key
+            }
+        ]
+    })
+    return blocks
+
 
 # register checks if app is working or not : if it is working when user pings the bot, it will respond with pong
-def register(app: App):
+def register(app: AsyncApp):
     @app.message("ping")
-    def ping_pong(message, say, logger):
-        say("pong")
+    async def ping_pong(message, say, logger):
+        await say("pong")
 
     @app.event("message")
-    def handle_message_events(event, client, say, logger):
+    async def handle_message_events(event, client, say, logger):
         # only file uploads
         if event.get("subtype") != "file_share":
             return
 
+        if (event.get("text") or "").strip().lower().startswith(BULK_ANALYZE_TRIGGER):
+            await _handle_bulk_analyze(event, client, say, logger)
+            return
+
         try:
-            say("⏳ Processing your document…")
+            await say("⏳ Processing your document…")
         except Exception as e:
             logger.warn(f"❌ Failed to send initial message: {e}")
             return
         
         try:
             file_meta = event["files"][0]
-            file_id = file_meta["id"]
-            info = client.files_info(file=file_id)["file"]
-            download_url = info["url_private_download"]
+            file, filename = await _download_file(client, file_meta["id"])
 
-            resp = requests.get(
-                download_url,
-                headers={"Authorization": f"Bearer {Config.SLACK_BOT_TOKEN}"}
-            )
-            resp.raise_for_status()
-            file_bytes = resp.content
-
-            analysis = analyze_document(file_bytes, filename=info.get("name"))
+            analysis = await analyze_document_async(file, filename=filename)
             
             # generate a short cache key
             cache_key = str(uuid.uuid4())
-            # store the payload for later
-            ANALYSIS_CACHE[cache_key] = [r.dict() for r in analysis.requirements]
-
-            # build the blocks
-            blocks = [
-                {
-                    "type": "section",
-                    "text": {
-                        "type": "mrkdwn",
-                        "text": f"*Found {analysis.total_requirements} requirements:*"
-                    }
-                }
-            ]
-            for req in analysis.requirements:
-                blocks.append({
-                    "type": "section",
-                    "text": {
-                        "type": "mrkdwn",
-                        "text": f"• *{req.id}*: {req.title} _(Priority: {req.priority})_"
-                    }
-                })
-
-            blocks.append({
-                "type": "actions",
-                "elements": [
-                    {
-                        "type": "button",
-                        "text": {"type": "plain_text", "text": "Create Jira Tasks"},
-                        "style": "primary",
-                        "action_id": "create_tasks",
-                        "value": cache_key
-                    }
-                ]
-            })
-
-            say(text="Document analysis complete! Review below:", blocks=blocks)
+            # store the payload for later (off the event loop: the cache may be Redis)
+            await asyncio.to_thread(ANALYSIS_CACHE.set, cache_key, analysis.requirements)
+
+            blocks = _preview_blocks(
+                analysis, cache_key, f"*Found {analysis.total_requirements} requirements:*"
+            )
+            await say(text="Document analysis complete! Review below:", blocks=blocks)
 
         except SlackApiError as e:
             logger.error(f"Slack API error: {e}")
-            say("❌ Failed to fetch file. Check permissions.")
-        except requests.HTTPError as e:
+            await say("❌ Failed to fetch file. Check permissions.")
+        except aiohttp.ClientError as e:
             logger.error(f"Download error: {e}")
-            say("❌ Could not download the document.")
+            await say("❌ Could not download the document.")
         except Exception as e:
             logger.error(f"Unhandled error during analysis: {e}")
-            say("❌ Unexpected error processing your document.")
+            await say("❌ Unexpected error processing your document.")
+
+    async def _handle_bulk_analyze(event, client, say, logger):
+        """
+        Analyse every attached document in one OpenAI batch and post a preview per file.
+        Batches are cheaper but can take hours, so this is meant for archived backlogs.
+        """
+        files = event.get("files") or []
+        try:
+            await say(
+                f"⏳ Submitting {len(files)} document(s) for bulk analysis. "
+                "This uses the OpenAI Batch API and can take a while…"
+            )
+        except Exception as e:
+            logger.warn(f"❌ Failed to send initial message: {e}")
+            return
+
+        try:
+            downloads = await asyncio.gather(
+                *(_download_file(client, file_meta["id"]) for file_meta in files)
+            )
+            analyses = await analyze_documents_batch(list(downloads))
+
+            for (_, filename), analysis in zip(downloads, analyses):
+                if analysis is None:
+                    await say(f"❌ Could not analyse *{filename}*.")
+                    continue
+
+                cache_key = str(uuid.uuid4())
+                await asyncio.to_thread(ANALYSIS_CACHE.set, cache_key, analysis.requirements)
+
+                blocks = _preview_blocks(
+                    analysis, cache_key,
+                    f"*{filename}*: found {analysis.total_requirements} requirements:"
+                )
+                await say(text=f"Bulk analysis of {filename} complete! Review below:", blocks=blocks)
+
+        except SlackApiError as e:
+            logger.error(f"Slack API error: {e}")
+            await say("❌ Failed to fetch files. Check permissions.")
+        except aiohttp.ClientError as e:
+            logger.error(f"Download error: {e}")
+            await say("❌ Could not download the documents.")
+        except Exception as e:
+            logger.error(f"Unhandled error during bulk analysis: {e}")
+            await say("❌ Unexpected error during bulk analysis.")
 
     @app.action("create_tasks")
-    def handle_create_tasks(ack, body, client, logger):
-        ack()
+    @app.action("force_create_tasks")
+    async def handle_create_tasks(ack, body, client, logger):
+        await ack()
         try:
-            cache_key = body["actions"][0]["value"]
-            requirements = ANALYSIS_CACHE.pop(cache_key, None)
+            action = body["actions"][0]
+            cache_key = action["value"]
+            force = action["action_id"] == "force_create_tasks"
+            requirements = await asyncio.to_thread(ANALYSIS_CACHE.pop, cache_key)
             if requirements is None:
-                client.chat_postMessage(
+                await client.chat_postMessage(
                     channel=body["channel"]["id"],
                     thread_ts=body["message"]["ts"],
                     text="❌ Sorry, I no longer have that analysis cached. Please re-upload the document."
                 )
                 return
 
-            created = create_jira_tasks(requirements)
+            # Jira calls are blocking; run them off the event loop
+            created = await asyncio.to_thread(create_jira_tasks, requirements, force)
             lines = [
                 f"• <{item['jira_url']}|{item['jira_key']}> for {item['requirement_id']}"
+                + (" _(already existed)_" if item["existing"] else "")
                 for item in created
             ]
-            client.chat_postMessage(
+            await client.chat_postMessage(
                 channel=body["channel"]["id"],
                 thread_ts=body["message"]["ts"],
                 text="Created the following Jira tasks:\n" + "\n".join(lines)
@@ -120,7 +220,7 @@ def register(app: App):
 
         except Exception as e:
             logger.error(f"Jira creation failed: {e}")
-            client.chat_postMessage(
+            await client.chat_postMessage(
                 channel=body["channel"]["id"],
                 thread_ts=body["message"]["ts"],
                 text="❌ Failed to create Jira tasks."